@@ -1,9 +1,11 @@
-import re
 import socket
-from logging import getLogger
-from typing import Optional
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass
+from logging import DEBUG, getLogger
+from typing import Callable, List, Optional, Tuple
 
-logger = getLogger()
+logger = getLogger(__name__)
 
 
 # Reference table for the ETH8020 (for which this module was originally developed for)
@@ -57,93 +59,103 @@ logger = getLogger()
 # | 123 | 7B  | Log Out - immediately re-enables TCP/IP password protection    |                           |    x    |
 # +-----+-----+----------------------------------------------------------------+---------------------------+---------+
 
+CMD_GET_MODULE_INFO = b'\x10'
+CMD_SET_RELAY_ON = b'\x20'
+CMD_SET_RELAY_OFF = b'\x21'
+CMD_SET_RELAY_STATE = b'\x23'
+CMD_GET_RELAY_STATE = b'\x24'
+CMD_GET_ANALOG_VALUE = b'\x32'
+CMD_ASCII_COMMAND = b'\x3a'
+CMD_GET_MAC_ADDRESS = b'\x77'
+CMD_GET_VOLTS = b'\x78'
+CMD_SEND_PASSWORD = b'\x79'
+CMD_GET_UNLOCK_TIME = b'\x7a'
+CMD_LOG_OUT = b'\x7b'
+
 COMMANDS = {
-    'get_module_info':  b'\x10',
-    'set_relay_on':     b'\x20',
-    'set_relay_off':    b'\x21',
-    'set_relay_state':  b'\x23',
-    'get_relay_state':  b'\x24',
-    'get_analog_value': b'\x32',
-    'ascii_command':    b'\x3a',
-    'get_mac_address':  b'\x77',
-    'get_volts':        b'\x78',
-    'send_password':    b'\x79',
-    'get_unlock_time':  b'\x7a',
-    'log_out':          b'\x7b',
+    'get_module_info':  CMD_GET_MODULE_INFO,
+    'set_relay_on':     CMD_SET_RELAY_ON,
+    'set_relay_off':    CMD_SET_RELAY_OFF,
+    'set_relay_state':  CMD_SET_RELAY_STATE,
+    'get_relay_state':  CMD_GET_RELAY_STATE,
+    'get_analog_value': CMD_GET_ANALOG_VALUE,
+    'ascii_command':    CMD_ASCII_COMMAND,
+    'get_mac_address':  CMD_GET_MAC_ADDRESS,
+    'get_volts':        CMD_GET_VOLTS,
+    'send_password':    CMD_SEND_PASSWORD,
+    'get_unlock_time':  CMD_GET_UNLOCK_TIME,
+    'log_out':          CMD_LOG_OUT,
 }
 
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """
+    Static capabilities of a module model
+    """
+    name: str
+    relays: int
+    digital_io: int
+    analog_input: int
+
+
 MODELS = {
-    18: {
-        'name': 'ETH002',
-        'relays': 2,
-        'digital_io': 0,
-        'analog_input': 0
-    },
-
-    19: {
-        'name': 'ETH008',
-        'relays': 8,
-        'digital_io': 0,
-        'analog_input': 0
-    },
-
-    20: {
-        'name': 'ETH484',
-        'relays': 4,
-        'digital_io': 8,
-        'analog_input': 4
-    },
-
-    21: {
-        'name': 'ETH8020',
-        'relays': 20,
-        'digital_io': 0,
-        'analog_input': 8
-    },
-
-    29: {
-        'name': 'ETH044',
-        'relays': 4,
-        'digital_io': 4,
-        'analog_input': 0
-    }
+    18: ModelSpec('ETH002', relays=2, digital_io=0, analog_input=0),
+    19: ModelSpec('ETH008', relays=8, digital_io=0, analog_input=0),
+    20: ModelSpec('ETH484', relays=4, digital_io=8, analog_input=4),
+    21: ModelSpec('ETH8020', relays=20, digital_io=0, analog_input=8),
+    29: ModelSpec('ETH044', relays=4, digital_io=4, analog_input=0),
 }
 
+# Command byte, relay number and pulse time for set_relay_on/off
+_RELAY_COMMAND = struct.Struct('>BBB')
+
+# Bit-reversal lookup table: _BITREV[b] is the byte b with its bit order flipped
+_BITREV = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+# _BIT_STRS[b] is the byte b as a bitstring, LSB first
+_BIT_STRS = [f"{_BITREV[b]:08b}" for b in range(256)]
+
+# Translation table which deletes all 0s and 1s from a string
+_BITS_TABLE = str.maketrans('', '', '01')
+
 
 def string_only_contains_bits(string):
     """
     Check if a string only contains bits (0s and 1s)
     """
-    search = re.compile(r'^[01]*$').search
-    return bool(search(string))
+    return not string.translate(_BITS_TABLE)
 
 
 def hex_to_int(data: bytes) -> int:
-    return int(data.hex(), 16)
+    return int.from_bytes(data, "big")
 
 
-def int_to_hex(data):
-    return chr(data)
+def int_to_hex(data: int) -> bytes:
+    return data.to_bytes(1, "big")
 
 
 def bitstring_to_hex(bitstring: str) -> bytes:
-    hex_string = b''
-
-    # Typos to avoid using reserved namespace \o/
-    _bytes = [bitstring[x:x+8] for x in range(0, len(bitstring), 8)]
-    for byte in _bytes:
-        hex_string += int(byte[::-1], 2).to_bytes(1, "big")
+    if not bitstring:
+        return b''
 
-    return hex_string
+    # Pad to whole bytes, pack the whole string in one go and flip the bit
+    # order of every byte, since the first bit in the string is the LSB
+    number_of_bytes = (len(bitstring) + 7) // 8
+    raw = int(bitstring.ljust(number_of_bytes * 8, '0'), 2).to_bytes(number_of_bytes, "big")
+    return raw.translate(_BITREV)
 
 
 def bytes_to_bitstring(bytes_string):
-    bitstring = ''
+    return ''.join(map(_BIT_STRS.__getitem__, bytes_string))
 
-    for byte in bytes_string:
-        bitstring += bin(byte)[2:].zfill(8)[::-1]
 
-    return bitstring
+def reply_is_set(result: bytes) -> bool:
+    """
+    Turn a 1-byte reply into a bool. The set commands answer 1 on success
+    and 0 on failure (see the reference table above)
+    """
+    return bool(result[0])
 
 
 class ETHRelay:
@@ -155,53 +167,78 @@ class ETHRelay:
     no_digital_io: int
     no_analog_input: int
     model_name: str
+    spec: ModelSpec
 
     sock: socket.socket
     connected: bool = False
 
-    def __init__(self, ip, port=17494, password=None):
+    # Bitmap of the relay states, bit 0 being relay 1
+    state_bits: int = 0
+
+    # Commands queued up by batch(), and the reply length and handler for each
+    _batch: Optional[bytearray] = None
+    _batch_replies: List[Tuple[int, Callable[[bytes], object]]]
+
+    def __init__(self, ip, port=17494, password=None, timeout=5.0):
         self.ip = ip
         self.port = port
         self.password = password
+        self.timeout = timeout
+
+        if not self.connect(ip, port, password, timeout):
+            raise ConnectionError(f"Could not connect to relay module at {ip}:{port}")
+
+        if not self.get_module_info():
+            self.sock.close()
+            self.connected = False
+            raise ValueError(f"Unsupported relay module: model id {self.model_id} is not defined in MODELS")
 
-        self.connect(ip, port, password)
-        self.get_module_info()
         if self.no_relays > 0:
-            self.states = self.get_multiple_relays_state()
-        else:
-            self.states = {}
+            self.get_multiple_relays_state()
 
-    def connect(self, ip, port, password=None):
+    def connect(self, ip, port, password=None, timeout=5.0):
         """
         Try to connect to a module using the inputted parameters.
 
+        timeout
+            Number of seconds to wait for the connection and for each
+            command reply before giving up, so a hung module can't block
+            forever. None waits indefinitely.
+
         Return values:
             True/False: Whether the connection was successful or not
         """
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.connected = False
         # Let's try to connect
         try:
-            self.sock.connect((ip, port))
+            self.sock = socket.create_connection((ip, port), timeout=timeout)
         except Exception as e:
             # The connection could fail for a multitude of reasons, in which
             # we will propagate any exception thrown by socket up the stack
             # by printing the exception
             logger.error(str(e))
-            self.sock.close()
             return False
-            
+
+        # Commands and replies are only a few bytes each, so don't let Nagle's
+        # algorithm hold them back waiting for more data
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
         # At this point we have a socket connection, and we must authenticate
-        # against the module if it requires so
-        if not self.get_unlock_time:
+        # against the module if it requires so. Modules without a password
+        # answer 255 here, so they are ready after this single round-trip
+        if self.get_unlock_time() is False:
             # If this is false, we need to authenticate with password
+            if password is None:
+                logger.error("Module is locked, but no password was given")
+                self.sock.close()
+                return False
+
             unlocked = self.unlock(password)
             if not unlocked:
                 logger.debug("Failed to unlock module. Try again.")
                 return False
-            
-            self.connected = True
 
+        self.connected = True
         return True
 
     def disconnect(self):
@@ -213,39 +250,31 @@ class ETHRelay:
         logger.debug("Relay disconnected")
         return True
         
-    def bitstring_to_dict(self, bitstring):
-        """
-        Turn a bitstring (like '10010111') into a dict like {1: True, 2: False ...}
-        for easier processing of the bit values based on their position
-        """
-    
-        vals = {}
-        for i, val in enumerate(bitstring):
-            # Make sure we don't think we have more relays than we actually have
-            if i >= self.no_relays:
-                break
-            vals[i+1] = bool(int(val))
-        
-        return vals
-
-    def dict_to_bitstring(self, _dict: dict[int, str]):
+    def check_relay(self, relay) -> bool:
         """
-        Turn a dict (with integers as keys) into a bitstring
+        Check that relay is the number of one of the relays on this module
         """
-        # Dirtily validate the keys
-        for k in _dict.keys():
-            if not isinstance(k, int):
-                logger.warning(f"Value {k} is not integer (it is {type(k)})")
-                return False
-            elif k > self.no_relays:
-                logger.warning("Value {k} too large; number of relays on this module is {self.no_relays}")
+        # bool is a subclass of int, but True is hardly meant as relay 1
+        if not isinstance(relay, int) or isinstance(relay, bool):
+            logger.warning("Value %s is not integer (it is %s)", relay, type(relay))
+            return False
+        elif not 1 <= relay <= self.no_relays:
+            logger.warning("Value %s out of range; number of relays on this module is %s", relay, self.no_relays)
+            return False
 
-        vals = ''
-        # We want to iterate through the three bytes of data we might end up sending
-        for i in range(1, 25):
-            vals += str(int(_dict.get(i, False)))
+        return True
+
+    def dict_to_bits(self, _dict: dict[int, bool]) -> int:
+        """
+        Turn a dict like {1: True, 2: False ...} into a bitmap (bit 0 being
+        relay 1). Keys which are not valid relay numbers are skipped
+        """
+        bits = 0
+        for k, v in _dict.items():
+            if self.check_relay(k) and v:
+                bits |= 1 << (k - 1)
 
-        return vals
+        return bits
 
     def send_command(self, command: bytes, value: Optional[bytes] = None, number_of_bytes: int = 1) -> bytes:
         """
@@ -254,52 +283,136 @@ class ETHRelay:
             Most cases, we will expect a 1-byte response (default) but it can also be
             easily overridden to expect a different response length.
         """
+        if self._batch is not None:
+            # Sending now would overtake the commands already queued up
+            raise RuntimeError("Only commands supporting batch() can be used inside a batch")
+
         if value:
+            # Opcode and payload go out as one buffer in a single sendall
             command = command + value
         try:
             self.sock.sendall(command)
         except Exception as e:
-            logger.error(f"Error sending command to relay ({e})")
+            logger.error("Error sending command to relay (%s)", e)
 
         result = self.read_command_result(number_of_bytes)
         return result
 
+    def run_command(self, command: bytes, value: Optional[bytes], handler: Callable[[bytes], object],
+                    number_of_bytes: int = 1):
+        """
+        Send a command and return the reply as interpreted by handler.
+        Inside a batch() block, the command is queued instead and None is
+        returned; the handled reply ends up in the list yielded by batch()
+        """
+        if self._batch is None:
+            return handler(self.send_command(command, value, number_of_bytes))
+
+        self._batch += command
+        if value:
+            self._batch += value
+        self._batch_replies.append((number_of_bytes, handler))
+        return None
+
+    def reject_command(self):
+        """
+        Answer False for a command which was refused before being sent.
+        Inside a batch() block the False is put in the results instead, so
+        they still line up with the calls made
+        """
+        if self._batch is None:
+            return False
+
+        self._batch_replies.append((0, lambda result: False))
+        return None
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue up commands and send them to the module in one go when the
+        block exits, reading all the replies back with a single read:
+
+            with relay.batch() as results:
+                relay.set_relay_on(1)
+                relay.set_relay_on(2)
+            # results == [True, True]
+
+        Calls refused up front (like an invalid relay number) get False in
+        results without anything being sent.
+
+        Only set_relay_on and set_relay_off can be queued; any other command
+        raises RuntimeError inside the block, as it would otherwise be sent
+        ahead of the queued ones. Nothing is sent if the block raises an
+        exception.
+        """
+        if self._batch is not None:
+            raise RuntimeError("Batches can not be nested")
+
+        self._batch = bytearray()
+        self._batch_replies = []
+        results = []
+        try:
+            yield results
+            commands, replies = self._batch, self._batch_replies
+        finally:
+            self._batch = None
+            self._batch_replies = []
+
+        if commands:
+            try:
+                self.sock.sendall(commands)
+            except Exception as e:
+                logger.error("Error sending command to relay (%s)", e)
+                raise
+
+            result = self.read_command_result(sum(number_of_bytes for number_of_bytes, _ in replies))
+        else:
+            result = b''
+
+        offset = 0
+        for number_of_bytes, handler in replies:
+            results.append(handler(result[offset:offset+number_of_bytes]))
+            offset += number_of_bytes
+
     def read_command_result(self, number_of_bytes: int) -> bytes:
         """
         Read the number of bytes from the socket
         """
-        chunks = []
+        buffer = bytearray(number_of_bytes)
+        view = memoryview(buffer)
         number_of_bytes_received = 0
         while number_of_bytes_received < number_of_bytes:
-            logger.debug(f"Getting byte {number_of_bytes_received+1}")
-            chunk = self.sock.recv(min(number_of_bytes - number_of_bytes_received, 2048))
-            if chunk == '':
+            # Ask for everything that is still missing; small replies nearly
+            # always arrive in a single recv
+            received = self.sock.recv_into(view[number_of_bytes_received:])
+            if not received:
                 logger.error("Error reading message - premature end of message")
                 raise RuntimeError("socket connection broken")
-            chunks.append(chunk)
-            number_of_bytes_received += len(chunk)
-        logger.debug(f"Chunks:, {[x.hex() for x in chunks]}")
-        return b"".join(chunks)
+            number_of_bytes_received += received
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("Received: %s", buffer.hex())
+        return bytes(buffer)
 
     def get_module_info(self):
         """
         Get info about our module and store it as attributes of self
         """
-        result = self.send_command(COMMANDS['get_module_info'], number_of_bytes=3)
+        result = self.send_command(CMD_GET_MODULE_INFO, number_of_bytes=3)
         self.model_id = result[0]
         self.software_version = result[1]
         self.firmware_version = result[2]
 
         try:
-            model = MODELS[self.model_id]
-        except AttributeError:
-            logger.debug(f"Invalid model: {self.model_id} is not defined in MODELS.")
+            spec = MODELS[self.model_id]
+        except KeyError:
+            logger.warning("Invalid model: %s is not defined in MODELS.", self.model_id)
             return False
 
-        self.no_relays = model['relays']
-        self.no_digital_io = model['digital_io']
-        self.no_analog_input = model['analog_input']
-        self.model_name = model['name']
+        self.spec = spec
+        self.no_relays = spec.relays
+        self.no_digital_io = spec.digital_io
+        self.no_analog_input = spec.analog_input
+        self.model_name = spec.name
 
         return True
 
@@ -312,7 +425,7 @@ class ETHRelay:
         If unlocked and will lock in a number of seconds
             Returns the time before the module will lock
         """
-        result = self.send_command(COMMANDS['get_unlock_time'])
+        result = self.send_command(CMD_GET_UNLOCK_TIME)
         if result[0] == 0:
             # The module is locked and needs to be unlocked
             return False
@@ -327,7 +440,9 @@ class ETHRelay:
         """
         Send a password to the module to unlock it
         """
-        result = self.send_command(COMMANDS['send_password'], value=password)
+        if isinstance(password, str):
+            password = password.encode("latin-1")
+        result = self.send_command(CMD_SEND_PASSWORD, value=password)
         
         if result[0] == 1:
             logger.debug("Wrong password")
@@ -340,68 +455,69 @@ class ETHRelay:
         """
         Send a command to log out from the module
         """
-        result = self.send_command(COMMANDS['log_out'])
+        result = self.send_command(CMD_LOG_OUT)
         success = result[0]
         if success:
             return True
         else:
             return False
 
+    def _set_relay(self, command: bytes, relay: int, pulse: int):
+        if pulse < 0 or pulse > 255 or not self.check_relay(relay):
+            return self.reject_command()
+
+        def handle_reply(result: bytes) -> bool:
+            success = reply_is_set(result)
+            # A pulsed relay falls back to its previous state by itself, so
+            # only permanent changes are tracked in state_bits
+            if success and not pulse:
+                if command == CMD_SET_RELAY_ON:
+                    self.state_bits |= 1 << (relay - 1)
+                else:
+                    self.state_bits &= ~(1 << (relay - 1))
+            return success
+
+        # The set_relay_on/off-commands are three bytes: the command, the
+        # number of the relay and an optional pulse value in the range of 0 and 255
+        return self.run_command(_RELAY_COMMAND.pack(command[0], relay, pulse), None, handle_reply)
+
     def set_relay_on(self, relay: int, pulse: int = 0):
         """
         Set the state of a single relay. This function can also trigger
         pulse the relay. The pulse value is defined in the range of 1-255,
         and translates to multiples of 100ms (100ms to 25.5s)
         """
-        if pulse < 0 or pulse > 255:
-            return False
+        return self._set_relay(CMD_SET_RELAY_ON, relay, pulse)
 
-        # The set_replay_on-command requires the number of the relay and an
-        # optional pulse value in the range of 0 and 255
-        values = relay.to_bytes(1, "big") + pulse.to_bytes(1, "big")
-        
-        # And this is a three-byte command (command + relay + pulse), so we
-        # need to specify that to send_command
-        result = self.send_command(COMMANDS['set_relay_on'], values)
-        
-        if result[0]:
-            return True
-        else:
-            return False
-
-    def set_relay_off(self, relay, pulse=0):
+    def set_relay_off(self, relay: int, pulse: int = 0):
         """
         Set the state of a single relay. This function can also trigger
         pulse the relay. The pulse value is defined in the range of 1-255,
         and translates to multiples of 100ms (100ms to 25.5s)
         """
-        if pulse < 0 or pulse > 255:
-            return False
-
-        # The set_replay_on-command requires the number of the relay and an
-        # optional pulse value in the range of 0 and 255
-        values = relay.to_bytes(1, "big") + pulse.to_bytes(1, "big")
-        result = self.send_command(COMMANDS['set_relay_off'], values)
-        
-        if result[0]:
-            return True
-        else:
-            return False
+        return self._set_relay(CMD_SET_RELAY_OFF, relay, pulse)
 
     def set_multiple_relays_state(self, _dict):
         """
-        Take a dict of relay states, turn it into a bitstring and send it off
+        Take a dict of relay states, turn it into a bitmap and send it off
         to the relay to turn stuff on or off.
         """
-        bitstring = self.dict_to_bitstring(_dict)
-        hex_string = bitstring_to_hex(bitstring)
-        result = self.send_command(COMMANDS['set_relay_state'], hex_string)
-        logger.debug("Setting values, bitstring %s" % bitstring)
+        return self.set_relay_bits(self.dict_to_bits(_dict))
 
-        if result[0]:
+    def set_relay_bits(self, bits: int):
+        """
+        Send a bitmap of relay states (bit 0 being relay 1) to the module,
+        and keep track of it if the module accepts it
+        """
+        result = self.send_command(CMD_SET_RELAY_STATE, bits.to_bytes(3, "little"))
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("Setting values, bitmap %s", bin(bits))
+
+        if not reply_is_set(result):
             return False
-        else:
-            return True
+
+        self.state_bits = bits
+        return True
 
     def set_relay_state(self, relay, state, turn_off_rest=False):
         """
@@ -409,32 +525,108 @@ class ETHRelay:
             Set all the other relays to open. The module usually does
             this by default
         """
-        
-        if turn_off_rest:
-            result = self.set_multiple_relays_state({relay: state})
+        if not self.check_relay(relay):
+            return False
+
+        mask = 1 << (relay - 1)
+        bits = 0 if turn_off_rest else self.state_bits
+
+        if state:
+            bits |= mask
         else:
-            states = self.states
-            states[relay] = state
-            result = self.set_multiple_relays_state(states)
-            self.states = states
+            bits &= ~mask
 
-        return result
+        return self.set_relay_bits(bits)
+
+    def bits_to_dict(self, bits: int):
+        """
+        Turn a bitmap of relay states into a dict like {1: True, 2: False ...}
+        """
+        return {i+1: bool(bits >> i & 1) for i in range(self.no_relays)}
+
+    @property
+    def states(self):
+        """
+        The last known relay states as a dict like {1: True, 2: False ...}.
+        Built from state_bits on access, so prefer state_bits internally.
+
+        The dict is a fresh copy, so changing it in place has no effect;
+        assign a dict to states to update the known states instead. Neither
+        sends anything to the module, use set_multiple_relays_state for that
+        """
+        return self.bits_to_dict(self.state_bits)
+
+    @states.setter
+    def states(self, _dict):
+        self.state_bits = self.dict_to_bits(_dict)
 
     def get_multiple_relays_state(self):
         """
         Ask the module to tell us about the state of all the relays
         """
-        result = self.send_command(COMMANDS['get_relay_state'], number_of_bytes=3)
-        bitstring = bytes_to_bitstring(result)
-        
+        result = self.send_command(CMD_GET_RELAY_STATE, number_of_bytes=3)
+
         if result:
-            return self.bitstring_to_dict(bitstring)
+            self.state_bits = int.from_bytes(result, "little")
+            return self.bits_to_dict(self.state_bits)
         else:
             return False
 
-    def get_relay_state(self, relay):
+    def get_relay_state(self, relay, refresh=False):
         """
-        Ask the module to tell us about the state of all the relays and find one of the relys
+        Look up the state of one of the relays from the last known states.
+
+        refresh:
+            Ask the module about the state of all the relays first, in case
+            they have been changed by someone else (or a pulse has ended)
         """
-        bitstring = self.get_multiple_relays_state()
-        return bool(int(bitstring[relay]))
+        if not self.check_relay(relay):
+            return False
+
+        if refresh:
+            self.get_multiple_relays_state()
+        return bool(self.state_bits >> (relay - 1) & 1)
+
+
+def poll_many(relays: List[ETHRelay]) -> List[Optional[int]]:
+    """
+    Refresh the relay states of several modules at once. The request is sent
+    to every module before any of the replies are read, so polling many
+    modules takes about one round-trip rather than one per module.
+
+    Returns the state bitmaps (bit 0 being relay 1) in the same order as
+    relays, with None for modules which aren't connected, are in the middle
+    of a batch() or failed to answer. A module which fails is disconnected,
+    since an unread reply would otherwise be mistaken for the answer to its
+    next command
+    """
+    def drop(relay, e):
+        logger.error("Error polling relay at %s (%s)", relay.ip, e)
+        relay.sock.close()
+        relay.connected = False
+
+    sent = []
+    for relay in relays:
+        if not relay.connected:
+            continue
+        elif relay._batch is not None:
+            # Polling now would overtake the commands queued up in the batch
+            logger.warning("Not polling relay at %s while a batch is open", relay.ip)
+            continue
+        try:
+            relay.sock.sendall(CMD_GET_RELAY_STATE)
+        except Exception as e:
+            drop(relay, e)
+            continue
+        sent.append(relay)
+
+    states = {}
+    for relay in sent:
+        try:
+            relay.state_bits = int.from_bytes(relay.read_command_result(3), "little")
+        except Exception as e:
+            drop(relay, e)
+        else:
+            states[id(relay)] = relay.state_bits
+
+    return [states.get(id(relay)) for relay in relays]
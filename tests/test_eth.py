@@ -0,0 +1,207 @@
+import socket
+import unittest
+from unittest import mock
+
+from devantech_relays import eth
+
+
+class FakeModule:
+    """
+    Stands in for the socket to a relay module, answering commands the way
+    an ETH8020 does (1/0 = success/fail for the set commands)
+    """
+    # Length of each command, including the command byte
+    COMMAND_LENGTHS = {0x10: 1, 0x20: 3, 0x21: 3, 0x23: 4, 0x24: 1, 0x7a: 1, 0x7b: 1}
+
+    def __init__(self, model_id=21):
+        self.model_id = model_id
+        self.state_bits = 0
+        self.sent = bytearray()
+        self.pending = bytearray()
+        self.replies = bytearray()
+        self.mute = False
+        self.fail_send = False
+        self.closed = False
+
+    def setsockopt(self, *args):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def sendall(self, data):
+        if self.fail_send:
+            raise OSError("send failed")
+        self.sent += data
+        self.pending += data
+        while self.pending and len(self.pending) >= self.COMMAND_LENGTHS[self.pending[0]]:
+            length = self.COMMAND_LENGTHS[self.pending[0]]
+            command = bytes(self.pending[:length])
+            del self.pending[:length]
+            if not self.mute:
+                self.replies += self.answer(command)
+
+    def answer(self, command):
+        if command[0] == 0x10:
+            return bytes((self.model_id, 1, 2))
+        elif command[0] in (0x20, 0x21):
+            relay, pulse = command[1], command[2]
+            if not pulse:
+                if command[0] == 0x20:
+                    self.state_bits |= 1 << (relay - 1)
+                else:
+                    self.state_bits &= ~(1 << (relay - 1))
+            return b'\x01'
+        elif command[0] == 0x23:
+            self.state_bits = int.from_bytes(command[1:], "little")
+            return b'\x01'
+        elif command[0] == 0x24:
+            return self.state_bits.to_bytes(3, "little")
+        elif command[0] == 0x7a:
+            return b'\xff'
+        elif command[0] == 0x7b:
+            return b'\x01'
+
+    def recv_into(self, view):
+        if not self.replies:
+            raise socket.timeout("timed out")
+        received = min(len(view), len(self.replies))
+        view[:received] = self.replies[:received]
+        del self.replies[:received]
+        return received
+
+
+def connect(module):
+    with mock.patch("socket.create_connection", return_value=module):
+        return eth.ETHRelay("10.10.10.10")
+
+
+class ConnectTest(unittest.TestCase):
+    def test_known_model(self):
+        relay = connect(FakeModule(model_id=19))
+        self.assertIs(relay.spec, eth.MODELS[19])
+        self.assertEqual(relay.no_relays, 8)
+        self.assertEqual(len(relay.states), 8)
+
+    def test_unknown_model_raises(self):
+        module = FakeModule(model_id=99)
+        with self.assertRaises(ValueError):
+            connect(module)
+        self.assertTrue(module.closed)
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.module = FakeModule()
+        self.relay = connect(self.module)
+        self.module.sent.clear()
+
+    def test_commands_are_sent_together(self):
+        with self.relay.batch() as results:
+            self.assertIsNone(self.relay.set_relay_on(1))
+            self.relay.set_relay_on(2)
+            self.relay.set_relay_off(1)
+
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(bytes(self.module.sent), bytes.fromhex("200100 200200 210100"))
+        self.assertEqual(self.relay.state_bits, 0b10)
+
+    def test_refused_calls_keep_their_place(self):
+        with self.relay.batch() as results:
+            self.relay.set_relay_on(1)
+            self.relay.set_relay_on(0)
+            self.relay.set_relay_on(2, pulse=300)
+            self.relay.set_relay_on(3)
+
+        self.assertEqual(results, [True, False, False, True])
+        self.assertEqual(bytes(self.module.sent), bytes.fromhex("200100 200300"))
+
+    def test_only_refused_calls(self):
+        with self.relay.batch() as results:
+            self.relay.set_relay_on(0)
+
+        self.assertEqual(results, [False])
+        self.assertEqual(self.module.sent, b'')
+
+    def test_unbatchable_command_raises(self):
+        with self.assertRaises(RuntimeError):
+            with self.relay.batch():
+                self.relay.set_relay_on(1)
+                self.relay.set_relay_state(2, True)
+
+        self.assertEqual(self.module.sent, b'')
+        self.assertIsNone(self.relay._batch)
+
+    def test_send_failure_is_raised(self):
+        self.module.fail_send = True
+        with self.assertRaises(OSError):
+            with self.relay.batch():
+                self.relay.set_relay_on(1)
+
+        self.assertIsNone(self.relay._batch)
+
+
+class RelayStateTest(unittest.TestCase):
+    def setUp(self):
+        self.module = FakeModule()
+        self.relay = connect(self.module)
+
+    def test_on_off_and_bitmap_share_the_cache(self):
+        self.assertTrue(self.relay.set_relay_on(3))
+        self.assertTrue(self.relay.get_relay_state(3))
+
+        self.assertTrue(self.relay.set_relay_state(5, True))
+        self.assertEqual(self.module.state_bits, 0b10100)
+        self.assertEqual(self.relay.state_bits, 0b10100)
+
+    def test_failed_replies_are_not_cached(self):
+        self.module.answer = lambda command: b'\x00'
+
+        self.assertFalse(self.relay.set_relay_on(3))
+        self.assertFalse(self.relay.set_relay_state(5, True))
+        self.assertEqual(self.relay.state_bits, 0)
+
+    def test_invalid_relay_numbers_are_refused(self):
+        self.module.sent.clear()
+        for relay in (0, 21, True, '1'):
+            self.assertFalse(self.relay.set_relay_on(relay))
+            self.assertFalse(self.relay.set_relay_state(relay, True))
+            self.assertFalse(self.relay.get_relay_state(relay))
+
+        self.assertTrue(self.relay.set_multiple_relays_state({0: True, 2: True, 25: True, True: True}))
+        self.assertEqual(bytes(self.module.sent), bytes.fromhex("23020000"))
+
+
+class PollManyTest(unittest.TestCase):
+    def setUp(self):
+        self.modules = [FakeModule() for _ in range(3)]
+        self.relays = [connect(module) for module in self.modules]
+        for i, module in enumerate(self.modules):
+            module.state_bits = i + 5
+
+    def test_polls_every_module(self):
+        self.assertEqual(eth.poll_many(self.relays), [5, 6, 7])
+        self.assertTrue(self.relays[2].get_relay_state(3))
+
+    def test_timed_out_module_is_dropped(self):
+        self.modules[0].mute = True
+
+        self.assertEqual(eth.poll_many(self.relays), [None, 6, 7])
+        self.assertFalse(self.relays[0].connected)
+        self.assertTrue(self.modules[0].closed)
+
+        # The other modules have no leftover replies in their sockets
+        self.assertTrue(self.relays[1].set_relay_on(1))
+        self.assertEqual(self.relays[1].get_multiple_relays_state()[1], True)
+
+    def test_skips_disconnected_and_batching_modules(self):
+        self.relays[0].connected = False
+        with self.relays[1].batch():
+            self.relays[1].set_relay_on(4)
+            self.assertEqual(eth.poll_many(self.relays), [None, None, 7])
+
+        self.assertEqual(bytes(self.modules[1].sent[-3:]), bytes.fromhex("200400"))
+
+
+if __name__ == "__main__":
+    unittest.main()